@@ -1,13 +1,58 @@
 import streamlit as st
 import google.generativeai as genai
-import json
+from google import genai as genai_sdk
+from google.api_core.exceptions import ResourceExhausted
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+import asyncio
+import concurrent.futures
+import diskcache
+import hashlib
+import orjson
 import random
 import math
+import threading
 import time
 
 # --- Configuration and Setup ---
 st.set_page_config(page_title="AI Excel Interviewer", layout="wide")
 
+# When enabled, every answer is scored as soon as it is submitted so the interviewer
+# can give hints and end the interview early. Otherwise answers are only collected
+# and all of them are scored together in a single request once the interview is over.
+ADAPTIVE_INTERVIEW = False
+
+# When enabled, the end-of-interview evaluation and the final report are submitted as
+# Gemini batch jobs, which are billed at a lower rate than real-time requests but can
+# take several minutes to complete.
+USE_BATCH_MODE = False
+BATCH_POLL_INTERVAL = 10  # seconds between batch job status checks
+BATCH_COMPLETED_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+# Number of questions asked in one interview
+INTERVIEW_LENGTH = 8
+
+# Answers are evaluated in requests of up to EVAL_BATCH_SIZE answers each. This covers a
+# whole interview, so it is only split if INTERVIEW_LENGTH is raised above it; the extra
+# requests are then sent concurrently, at most MAX_CONCURRENT_REQUESTS at a time.
+EVAL_BATCH_SIZE = INTERVIEW_LENGTH
+MAX_CONCURRENT_REQUESTS = 4
+
+# Only the most recent chat messages are kept in session state and sent to the browser;
+# the full interview is kept in `results` and rebuilt from there when needed.
+CHAT_WINDOW = 10
+
+# Answers with fewer words than this (and no formula) get the lowest score without an LLM call
+MIN_ANSWER_WORDS = 3
+
+# Evaluations are cached on disk, so identical answers to the same question are only
+# sent to Gemini once, across sessions and restarts
+EVAL_CACHE_DIR = "/tmp/interview_eval_cache"
+EVAL_CACHE_SIZE_LIMIT = 100 * 1024 * 1024  # bytes
+EVAL_CACHE_EXPIRE = 7 * 24 * 60 * 60  # seconds
+
+# Gemini requests per minute allowed by the API key's quota tier
+REQUESTS_PER_MINUTE = 10
+
 try:
     genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
 except KeyError:
@@ -15,33 +60,58 @@ except KeyError:
     st.stop()
 
 # --- Knowledge Base Loading ---
-@st.cache_data
+@st.cache_resource
 def load_questions(filepath="interview_questions.json"):
-    with open(filepath, 'r') as f:
-        return json.load(f)
+    # Shared between sessions without copying, so it is returned as an immutable tuple
+    with open(filepath, 'rb') as f:
+        return tuple(orjson.loads(f.read()))
+
+QUESTION_BANK = load_questions()
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """Token bucket rate limiter that allows bursts of up to `capacity` requests
+    and refills at `rate` requests per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token and returns how many seconds to wait before it may be used."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def acquire_async(self):
+        await asyncio.sleep(self.reserve())
+
+@st.cache_resource
+def get_rate_limiter():
+    # The quota belongs to the API key, so every session draws from the same bucket
+    return TokenBucket(rate=REQUESTS_PER_MINUTE / 60, capacity=REQUESTS_PER_MINUTE)
 
 # --- Prompt Templates ---
-EVALUATION_PROMPT_TEMPLATE = """
-You are an expert Excel Interview Evaluator. Your task is to analyze a candidate's answer to an interview question.
-You must provide a numeric score from 1 to 5 and a brief justification for your score based on the provided rubric.
-Your entire output must be a single, valid JSON object.
-
-**Rubric:**
-- 5: Excellent. The answer is accurate, complete, and demonstrates deep understanding.
-- 4: Good. The answer is mostly correct but may have minor inaccuracies.
-- 3: Satisfactory. The answer demonstrates a basic understanding but is incomplete or contains notable errors.
-- 2: Poor. The answer is largely incorrect and shows a fundamental misunderstanding.
-- 1: Very Poor. The answer is completely wrong or irrelevant.
-
-**Interview Question:**
-{question}
-
-**Candidate's Answer:**
-{answer}
-
-**Evaluation Rubric for this question:**
-{rubric}
-"""
+# The rubric, role and output format are identical for every evaluation, so they live in
+# the evaluator's system instruction and each request only carries the items themselves.
+EVAL_SYSTEM_INSTRUCTION = (
+    "You are an expert Excel interview evaluator. Score each item's answer from 1 to 5 using "
+    "its rubric and this scale: 5 accurate, complete, deep understanding; 4 mostly correct, "
+    "minor inaccuracies; 3 basic understanding but incomplete or notable errors; 2 largely "
+    "incorrect, fundamental misunderstanding; 1 wrong or irrelevant. Reply only with a JSON "
+    'array, one object per item: [{"id":int,"score":int,"justification":str}]'
+)
+
+EVALUATION_PROMPT_TEMPLATE = "Items (id, question, answer, rubric):\n{items}"
 
 FINAL_REPORT_PROMPT_TEMPLATE = """
 You are a helpful and constructive hiring manager, specializing in data roles.
@@ -57,78 +127,369 @@ Based on the full transcript, provide a report with these sections:
 {transcript}
 """
 
-# Model configuration for JSON output
+# Model configuration for JSON output. A low temperature keeps repeated evaluations of
+# the same answer consistent.
+EVAL_TEMPERATURE = 0.1
 generation_config_json = genai.types.GenerationConfig(
-    response_mime_type="application/json"
+    response_mime_type="application/json",
+    temperature=EVAL_TEMPERATURE
 )
 
+# Each evaluation is a short JSON object, so the output is capped per item. Gemini 2.5
+# counts its thinking tokens towards max_output_tokens, so real-time requests leave room
+# for those too and are retried without the cap if thinking still runs past it. Batch
+# requests cannot be retried cheaply, so they turn thinking off instead.
+EVAL_OUTPUT_TOKENS_PER_ITEM = 128
+EVAL_THINKING_TOKEN_ALLOWANCE = 1024
+
+def eval_output_token_limit(item_count):
+    return EVAL_THINKING_TOKEN_ALLOWANCE + EVAL_OUTPUT_TOKENS_PER_ITEM * item_count
+
+MAX_TOKENS = genai.protos.Candidate.FinishReason.MAX_TOKENS
+
+MODEL_NAME = "gemini-2.5-flash"
+REPORT_SYSTEM_INSTRUCTION = "You are a helpful hiring manager writing a performance report in Markdown."
+
 # Initialize models
-eval_model = genai.GenerativeModel(
-    "gemini-2.5-flash",
-    system_instruction="You are an expert Excel evaluator that only responds in valid JSON.",
-    generation_config=generation_config_json
-)
-report_model = genai.GenerativeModel(
-    "gemini-2.5-flash",
-    system_instruction="You are a helpful hiring manager writing a performance report in Markdown."
+@st.cache_resource
+def get_models():
+    """Returns the (evaluation, report) models, shared across reruns and sessions."""
+    eval_model = genai.GenerativeModel(
+        MODEL_NAME,
+        system_instruction=EVAL_SYSTEM_INSTRUCTION,
+        generation_config=generation_config_json
+    )
+    report_model = genai.GenerativeModel(
+        MODEL_NAME,
+        system_instruction=REPORT_SYSTEM_INSTRUCTION
+    )
+    return eval_model, report_model
+
+@st.cache_resource
+def get_batch_client():
+    # Batch jobs are only exposed by the newer `google-genai` SDK
+    return genai_sdk.Client(api_key=st.secrets["GOOGLE_API_KEY"])
+
+def make_batch_request(prompt, system_instruction, generation_config=None):
+    """Builds an inline request for a Gemini batch job."""
+    config = {"system_instruction": system_instruction, **(generation_config or {})}
+    return {"contents": [{"parts": [{"text": prompt}], "role": "user"}], "config": config}
+
+class BatchJobFailed(RuntimeError):
+    """Raised when a batch job has finished but did not produce usable responses."""
+
+def run_batch_job(requests, display_name):
+    """Submits inline requests as a Gemini batch job, waits for it to finish and
+    returns the response texts in request order.
+
+    The job name is kept in session state, so a rerun while the job is still running
+    resumes polling the same job instead of submitting a new one. Errors while polling
+    are raised as-is and leave the job in place to be resumed; `BatchJobFailed` means
+    the job itself is done and a new one has to be submitted.
+    """
+    client = get_batch_client()
+    batch_jobs = st.session_state.batch_jobs
+    if display_name in batch_jobs:
+        job = client.batches.get(name=batch_jobs[display_name])
+    else:
+        job = client.batches.create(model=MODEL_NAME, src=requests, config={"display_name": display_name})
+        batch_jobs[display_name] = job.name
+    status = st.empty()
+    with st.spinner("Waiting for the batch job to complete..."):
+        while job.state.name not in BATCH_COMPLETED_STATES:
+            status.caption(f"Batch job `{job.name}` is {job.state.name}.")
+            time.sleep(BATCH_POLL_INTERVAL)
+            job = client.batches.get(name=job.name)
+    status.empty()
+    # The job is finished either way, so a later call should submit a new one
+    del batch_jobs[display_name]
+    if job.state.name != "JOB_STATE_SUCCEEDED":
+        raise BatchJobFailed(f"Batch job {job.name} ended in state {job.state.name}.")
+
+    texts = []
+    for inlined in job.dest.inlined_responses:
+        if inlined.error:
+            raise BatchJobFailed(f"Batch request failed: {inlined.error}")
+        texts.append(inlined.response.text)
+    return texts
+
+@st.cache_resource
+def get_event_loop():
+    """Starts the background thread whose event loop runs all async Gemini requests.
+
+    The SDK's async client is bound to the event loop it is first used on, so a
+    single long-lived loop is shared instead of calling `asyncio.run` per request.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="gemini-worker", daemon=True).start()
+    return loop
+
+def run_on_worker_loop(coroutine):
+    """Schedules a coroutine on the worker event loop and returns a
+    `concurrent.futures.Future` for its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+
+@retry(
+    retry=retry_if_exception_type(ResourceExhausted),
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True
 )
+async def evaluate_prompt_async(model, prompt, max_output_tokens, semaphore, rate_limiter):
+    """Sends one evaluation prompt, backing off exponentially when the quota is exhausted."""
+    async with semaphore:
+        await rate_limiter.acquire_async()
+        response = await model.generate_content_async(
+            prompt, generation_config={"max_output_tokens": max_output_tokens}
+        )
+        if response.candidates and response.candidates[0].finish_reason == MAX_TOKENS:
+            # Thinking used up the cap before the JSON was written, so ask once more without it
+            await rate_limiter.acquire_async()
+            response = await model.generate_content_async(prompt)
+    return response.text
+
+async def evaluate_prompts_async(model, prompts, token_limits, rate_limiter):
+    """Sends all evaluation prompts concurrently. Failed prompts yield their exception."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return await asyncio.gather(
+        *[
+            evaluate_prompt_async(model, prompt, max_output_tokens, semaphore, rate_limiter)
+            for prompt, max_output_tokens in zip(prompts, token_limits)
+        ],
+        return_exceptions=True
+    )
+
+def is_too_short(answer):
+    """Whether an answer is too short to be worth sending to the evaluator."""
+    answer = answer.strip()
+    # Formulas such as `=LARGE(A2:A100, 2)` are complete answers despite their few words
+    looks_like_formula = "=" in answer or "(" in answer
+    return len(answer.split()) < MIN_ANSWER_WORDS and not looks_like_formula
+
+@st.cache_resource
+def get_eval_cache():
+    """Returns the on-disk evaluation cache, shared by all sessions and kept across restarts."""
+    return diskcache.Cache(EVAL_CACHE_DIR, size_limit=EVAL_CACHE_SIZE_LIMIT)
+
+def evaluation_cache_key(item):
+    # The evaluator settings are part of the key, so changing them invalidates old scores
+    parts = (
+        MODEL_NAME, EVAL_SYSTEM_INSTRUCTION, str(EVAL_TEMPERATURE),
+        item['question'], item['answer'], item['rubric']
+    )
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+def submit_evaluations(items, use_batch_mode=False):
+    """Starts evaluating a batch of answers with Gemini.
+
+    `items` is a list of dicts with `id`, `question`, `answer` and `rubric` keys.
+    Answers that are too short, or that were already evaluated by any session, are
+    scored without a request. The rest are split into requests of up to
+    `EVAL_BATCH_SIZE` answers which are sent concurrently on the background event
+    loop, or as one Gemini batch job with `use_batch_mode`. Returns a handle to pass
+    to `collect_evaluations`.
+    """
+    eval_cache = get_eval_cache()
+    evaluations = {}
+    items_to_send = []
+    for item in items:
+        if is_too_short(item['answer']):
+            evaluations[item['id']] = {"score": 1, "justification": "Answer too short to evaluate."}
+        elif (cached_evaluation := eval_cache.get(evaluation_cache_key(item))) is not None:
+            evaluations[item['id']] = cached_evaluation
+        else:
+            items_to_send.append(item)
+
+    chunks = [items_to_send[i:i + EVAL_BATCH_SIZE] for i in range(0, len(items_to_send), EVAL_BATCH_SIZE)]
+    prompts = [
+        EVALUATION_PROMPT_TEMPLATE.format(items=orjson.dumps(chunk).decode())
+        for chunk in chunks
+    ]
+    token_limits = [eval_output_token_limit(len(chunk)) for chunk in chunks]
+    if not prompts:
+        responses = []
+    elif use_batch_mode:
+        requests = [
+            make_batch_request(prompt, EVAL_SYSTEM_INSTRUCTION, generation_config={
+                "response_mime_type": "application/json",
+                "temperature": EVAL_TEMPERATURE,
+                "max_output_tokens": EVAL_OUTPUT_TOKENS_PER_ITEM * len(chunk),
+                "thinking_config": {"thinking_budget": 0}
+            })
+            for prompt, chunk in zip(prompts, chunks)
+        ]
+        try:
+            responses = run_batch_job(requests, "interview-evaluations")
+        except BatchJobFailed as e:
+            responses = [e] * len(chunks)
+    else:
+        eval_model, _ = get_models()
+        responses = run_on_worker_loop(
+            evaluate_prompts_async(eval_model, prompts, token_limits, get_rate_limiter())
+        )
+    return {"evaluations": evaluations, "chunks": chunks, "responses": responses}
+
+def collect_evaluations(handle):
+    """Waits for evaluations started by `submit_evaluations` and returns a dict
+    mapping every item id to its evaluation JSON."""
+    evaluations = handle['evaluations']
+    chunks = handle['chunks']
+    response_texts = handle['responses']
+    if isinstance(response_texts, concurrent.futures.Future):
+        response_texts = response_texts.result()
+    eval_cache = get_eval_cache()
+
+    for chunk, response_text in zip(chunks, response_texts):
+        chunk_evaluations = {}
+        try:
+            if isinstance(response_text, Exception):
+                raise response_text
+            for evaluation in orjson.loads(response_text):
+                chunk_evaluations[evaluation['id']] = {
+                    "score": evaluation['score'], "justification": evaluation['justification']
+                }
+        except Exception as e:
+            st.error(f"An error occurred during evaluation: {e}. The response may not be valid JSON.")
+            error_message = f"Error during evaluation. Details: {str(e)}"
+        else:
+            error_message = "Error during evaluation. The answer was missing from the model's response."
+        for item in chunk:
+            if item['id'] in chunk_evaluations:
+                evaluations[item['id']] = chunk_evaluations[item['id']]
+                eval_cache.set(evaluation_cache_key(item), evaluations[item['id']], expire=EVAL_CACHE_EXPIRE)
+            else:
+                evaluations[item['id']] = {"score": 0, "justification": error_message}
+    return evaluations
 
-def evaluate_answer(question, answer, rubric):
-    """Uses Gemini to evaluate a single answer and return JSON."""
-    prompt = EVALUATION_PROMPT_TEMPLATE.format(question=question, answer=answer, rubric=rubric)
-    try:
-        response = eval_model.generate_content(prompt)
-        # Add a small delay to respect API rate limits
-        time.sleep(1)
-        return json.loads(response.text)
-    except Exception as e:
-        st.error(f"An error occurred during evaluation: {e}. The response may not be valid JSON.")
-        return {"score": 0, "justification": f"Error during evaluation. Details: {str(e)}"}
+def evaluate_answers_batch(items, use_batch_mode=False):
+    """Evaluates a batch of answers and waits for the results."""
+    return collect_evaluations(submit_evaluations(items, use_batch_mode=use_batch_mode))
 
-def generate_final_report(results):
-    """Uses Gemini to generate the final summary report."""
-    transcript = ""
+def generate_final_report(results, use_batch_mode=False):
+    """Uses Gemini to generate the final summary report.
+
+    This is a generator that yields the report as it streams in, for `st.write_stream`.
+    With `use_batch_mode` the report comes from a batch job and is yielded in one piece.
+    """
+    transcript_parts = []
     for i, res in enumerate(results):
-        transcript += f"**Question {i+1}:** {res['question']}\n"
-        transcript += f"**Candidate's Answer:** {res['answer']}\n"
-        transcript += f"**Score:** {res['evaluation']['score']}/5\n"
-        transcript += f"**Justification:** {res['evaluation']['justification']}\n\n---\n\n"
+        transcript_parts.append(
+            f"**Question {i+1}:** {res['question']}\n"
+            f"**Candidate's Answer:** {res['answer']}\n"
+            f"**Score:** {res['evaluation']['score']}/5\n"
+            f"**Justification:** {res['evaluation']['justification']}\n\n---\n\n"
+        )
+    transcript = "".join(transcript_parts)
 
     prompt = FINAL_REPORT_PROMPT_TEMPLATE.format(transcript=transcript)
+    if use_batch_mode:
+        # Only a finished job is reported here; polling errors propagate so the
+        # next rerun resumes the same job
+        request = make_batch_request(prompt, REPORT_SYSTEM_INSTRUCTION)
+        try:
+            [report] = run_batch_job([request], "interview-report")
+        except BatchJobFailed as e:
+            st.error(f"An error occurred while generating the report: {e}")
+            yield "Could not generate the final report due to an error."
+            return
+        yield report
+        return
     try:
-        response = report_model.generate_content(prompt)
-        time.sleep(1)
-        return response.text
+        _, report_model = get_models()
+        streamed = False
+        try:
+            get_rate_limiter().acquire()
+            for chunk in report_model.generate_content(prompt, stream=True):
+                streamed = True
+                yield chunk.text
+        except Exception as e:
+            if streamed:
+                # Part of the report is already on screen; flag it instead of appending
+                # an error to it, so the caller does not keep the incomplete report
+                st.error(f"The report was interrupted: {e}")
+                st.session_state.report_interrupted = True
+                return
+            # Streaming failed before any text arrived, so fall back to a regular request
+            get_rate_limiter().acquire()
+            yield report_model.generate_content(prompt).text
     except Exception as e:
         st.error(f"An error occurred while generating the report: {e}")
-        return "Could not generate the final report due to an error."
+        yield "Could not generate the final report due to an error."
+
+def record_result(question, answer, evaluation):
+    """Stores an evaluated answer and updates the running score totals."""
+    st.session_state.results.append({"question": question, "answer": answer, "evaluation": evaluation})
+    st.session_state.score_sum += evaluation['score']
+    st.session_state.score_count += 1
+
+def get_average_score():
+    if st.session_state.score_count == 0:
+        return 0
+    return st.session_state.score_sum / st.session_state.score_count
+
+def update_progress_widgets():
+    """Fills the progress and average score placeholders with the current values.
+
+    Called when the placeholders are created, so the widgets stay visible while an
+    answer is being evaluated, and again once it has been processed. The widgets are
+    only sent again if the progress changed since they were last filled in this run.
+    """
+    global rendered_progress
+    progress = (st.session_state.q_index, st.session_state.score_count)
+    if progress == rendered_progress:
+        return
+    rendered_progress = progress
+    total_questions = len(st.session_state.interview_questions)
+    questions_answered = st.session_state.q_index
+    progress_percent = questions_answered / total_questions if total_questions > 0 else 0
+    progress_placeholder.progress(progress_percent, text=f"Question {questions_answered}/{total_questions}")
+    average_score = get_average_score()
+    if average_score > 0:
+        metric_placeholder.metric(label="Average Score", value=f"{average_score:.2f} / 5.0")
+
+def render_message(message):
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+
+def build_transcript_messages(results):
+    """Rebuilds the question and answer chat messages of the whole interview from its results."""
+    messages = []
+    for res in results:
+        messages.append({"role": "assistant", "content": res['question']})
+        messages.append({"role": "user", "content": res['answer']})
+    return messages
 
 # --- Streamlit App UI & Logic ---
 st.title("🤖 AI Excel Interviewer (Powered by Gemini)")
-st.progress(0, text="Interview Progress")
 # --- State Management with Interactive Logic ---
+ADAPTIVE_INTRO = """1.  I will ask you a series of questions to assess your Excel skills.
+2.  If an answer isn't quite right, I may give you a hint and a chance to try again.
+3.  The interview will adapt based on your performance and may end early if a clear skill level is determined."""
+COLLECTING_INTRO = """1.  I will ask you a series of questions to assess your Excel skills.
+2.  Your answers will be evaluated together once you have answered every question."""
+
 if 'stage' not in st.session_state:
     st.session_state.stage = 'welcome'
     st.session_state.q_index = 0
     st.session_state.results = []
+    st.session_state.score_sum = 0
+    st.session_state.score_count = 0
+    st.session_state.pending = []
     st.session_state.retry_attempt = False
+    st.session_state.batch_jobs = {}
 
-    INTERVIEW_LENGTH = 8
-    full_question_list = load_questions()
-
-    if len(full_question_list) > INTERVIEW_LENGTH:
-        st.session_state.interview_questions = random.sample(full_question_list, k=INTERVIEW_LENGTH)
+    if len(QUESTION_BANK) > INTERVIEW_LENGTH:
+        st.session_state.interview_questions = random.sample(QUESTION_BANK, k=INTERVIEW_LENGTH)
     else:
-        st.session_state.interview_questions = full_question_list
+        st.session_state.interview_questions = list(QUESTION_BANK)
+    st.session_state.early_exit_threshold = math.ceil(len(st.session_state.interview_questions) * 0.75)
 
     st.session_state.messages = [{
         "role": "assistant",
-        "content": f"""Hello! I'm your adaptive AI interviewer.
+        "content": f"""Hello! I'm your {'adaptive ' if ADAPTIVE_INTERVIEW else ''}AI interviewer.
 
 **Here’s how this will work:**
-1.  I will ask you a series of questions to assess your Excel skills.
-2.  If an answer isn't quite right, I may give you a hint and a chance to try again.
-3.  The interview will adapt based on your performance and may end early if a clear skill level is determined.
+{ADAPTIVE_INTRO if ADAPTIVE_INTERVIEW else COLLECTING_INTRO}
 
 This session will have up to **{len(st.session_state.interview_questions)} questions**. Ready? Type **'start'**.
 """
@@ -136,94 +497,114 @@ This session will have up to **{len(st.session_state.interview_questions)} quest
 
 # --- Update Progress Bar & Average Score Display ---
 total_questions = len(st.session_state.interview_questions)
-questions_answered = st.session_state.q_index
-progress_percent = questions_answered / total_questions if total_questions > 0 else 0
-
-average_score = 0
-if st.session_state.results:
-    total_score = sum(res['evaluation']['score'] for res in st.session_state.results)
-    average_score = total_score / len(st.session_state.results)
 
 col1, col2 = st.columns(2)
-with col1:
-    st.progress(progress_percent, text=f"Question {questions_answered}/{total_questions}")
-with col2:
-    if average_score > 0:
-        st.metric(label="Average Score", value=f"{average_score:.2f} / 5.0")
+progress_placeholder = col1.empty()
+metric_placeholder = col2.empty()
+rendered_progress = None
+update_progress_widgets()
 
 # --- Display Chat History ---
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+chat_container = st.container()
+with chat_container:
+    for message in st.session_state.messages:
+        render_message(message)
 
 # --- Main App Logic ---
 if st.session_state.stage == 'interview_finished':
     st.success("The interview is complete! Generating your performance report...")
-    if 'report' not in st.session_state:
-        st.session_state.report = generate_final_report(st.session_state.results)
+    if st.session_state.pending:
+        # The evaluation may already have been started before the rerun
+        evaluation_handle = st.session_state.pop('evaluation_handle', None)
+        if evaluation_handle is None:
+            evaluation_handle = submit_evaluations(st.session_state.pending, use_batch_mode=USE_BATCH_MODE)
+        with st.spinner("Evaluating your answers..."):
+            evaluations = collect_evaluations(evaluation_handle)
+        for item in st.session_state.pending:
+            record_result(item['question'], item['answer'], evaluations[item['id']])
+        st.session_state.pending = []
+    update_progress_widgets()
+    with st.expander("Full interview transcript"):
+        for message in build_transcript_messages(st.session_state.results):
+            render_message(message)
     st.markdown("---")
     st.subheader("Your Performance Report")
-    st.markdown(st.session_state.report)
+    if 'report' not in st.session_state:
+        st.session_state.report_interrupted = False
+        report = st.write_stream(
+            generate_final_report(st.session_state.results, use_batch_mode=USE_BATCH_MODE)
+        )
+        if not st.session_state.report_interrupted:
+            st.session_state.report = report
+        else:
+            # The report is not stored, so the rerun triggered by the button generates it again
+            st.button("Regenerate report")
+    else:
+        st.markdown(st.session_state.report)
     st.stop()
 
 if prompt := st.chat_input("Your answer"):
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    with st.chat_message("user"):
-        st.markdown(prompt)
+    with chat_container:
+        render_message({"role": "user", "content": prompt})
 
     if st.session_state.stage == 'welcome':
         if 'start' in prompt.lower():
-            st.session_state.stage = 'interviewing'
-            first_question = st.session_state.interview_questions[0]['question']
-            st.session_state.messages.append({"role": "assistant", "content": first_question})
-            with st.chat_message("assistant"):
-                st.markdown(first_question)
-
+            st.session_state.stage = 'interviewing' if ADAPTIVE_INTERVIEW else 'collecting'
+            response = st.session_state.interview_questions[0]['question']
         else:
             response = "Please type 'start' to begin the interview."
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            with st.chat_message("assistant"):
-                st.markdown(response)
 
-    elif st.session_state.stage == 'interviewing':
+    elif st.session_state.stage in ('interviewing', 'collecting'):
         current_q_data = st.session_state.interview_questions[st.session_state.q_index]
+        answer_item = {
+            "id": st.session_state.q_index, "question": current_q_data['question'],
+            "answer": prompt, "rubric": current_q_data.get('rubric', '')
+        }
+
+        if st.session_state.stage == 'collecting':
+            # No LLM call here: all answers are evaluated in one batch when the interview ends
+            st.session_state.pending.append(answer_item)
+            evaluation = None
+        else:
+            # Hints and the early exit need a score right away, so evaluate a single-item batch
+            with st.spinner("Analyzing your response..."):
+                evaluation = evaluate_answers_batch([answer_item])[answer_item['id']]
 
-        with st.spinner("Analyzing your response..."):
-            evaluation = evaluate_answer(current_q_data['question'], prompt, current_q_data.get('rubric', ''))
-
-        if evaluation['score'] < 3 and not st.session_state.retry_attempt:
+        if evaluation is not None and evaluation['score'] < 3 and not st.session_state.retry_attempt:
             st.session_state.retry_attempt = True
             hint = current_q_data.get('hint', "Let's think about that from another angle.")
             response = f"That's not quite what I was looking for. Here's a hint: *{hint}* \n\nWhy don't you try answering that question again?"
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            with st.chat_message("assistant"):
-                st.markdown(response)
         else:
             st.session_state.retry_attempt = False
-            st.session_state.results.append({
-                "question": current_q_data['question'], "answer": prompt, "evaluation": evaluation
-            })
+            if evaluation is not None:
+                record_result(current_q_data['question'], prompt, evaluation)
             st.session_state.q_index += 1
+            average_score = get_average_score()
 
-            seventy_five_percent_mark = math.ceil(total_questions * 0.75)
-            if st.session_state.q_index >= seventy_five_percent_mark and average_score > 0 and average_score < 3.0:
+            if st.session_state.q_index >= st.session_state.early_exit_threshold and 0 < average_score < 3.0:
                 st.session_state.stage = 'interview_finished'
                 response = "Thank you for your time. Based on the responses so far, I have enough information to complete the assessment. I will now generate your performance report."
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                with st.chat_message("assistant"):
-                    st.markdown(response)
-                st.rerun()
-
             elif st.session_state.q_index < total_questions:
                 next_question = st.session_state.interview_questions[st.session_state.q_index]['question']
-                response = f"Thank you. Here is the next question:\n\n{next_question}"
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                with st.chat_message("assistant"):
-                    st.markdown(response)
+                acknowledgement = "Got it." if evaluation is None else "Thank you."
+                response = f"{acknowledgement} Here is the next question:\n\n{next_question}"
             else:
                 st.session_state.stage = 'interview_finished'
                 response = "Thank you, that was the final question. Please wait a moment while I generate your performance report."
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                with st.chat_message("assistant"):
-                    st.markdown(response)
-                st.rerun()
+
+    # Store the answer and the reply together so the browser receives a single update
+    st.session_state.messages.extend([
+        {"role": "user", "content": prompt},
+        {"role": "assistant", "content": response}
+    ])
+    del st.session_state.messages[:-CHAT_WINDOW]
+    with chat_container:
+        render_message(st.session_state.messages[-1])
+
+    if st.session_state.stage == 'interview_finished':
+        if st.session_state.pending and not USE_BATCH_MODE:
+            # Start evaluating in the background so the requests overlap with the rerun
+            st.session_state.evaluation_handle = submit_evaluations(st.session_state.pending)
+        st.rerun()
+
+update_progress_widgets()